@@ -1,12 +1,114 @@
 import boto3
 import logging
 import datetime
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Set up logging to CloudWatch. Info level is usually sufficient for these kinds of ops scripts.
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Adaptive retries log every backoff at INFO; keep that at WARNING so throttling
+# storms don't flood CloudWatch while still surfacing anything unusual.
+logging.getLogger('botocore.retries').setLevel(logging.WARNING)
+
+# KMS calls are I/O-bound (each one is a blocking HTTPS round trip), so fanning the
+# per-key work out over a small thread pool makes batch wall time roughly constant
+# instead of linear in the number of keys. Shared across invocations of a warm Lambda.
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("KMS_MAX_WORKERS", "16")))
+
+# Accounts this function must never run in (e.g., production). Override the
+# hardcoded default with a comma-separated KMS_BLOCKED_ACCOUNTS env var; built
+# once at import and a frozenset so the membership check is O(1).
+_BLOCKED_ACCOUNTS = frozenset(os.environ.get("KMS_BLOCKED_ACCOUNTS", "111122223333").split(","))
+
+# Shape of a full KMS key ARN; the mrk- prefix covers multi-region keys, which
+# the replication action depends on.
+_ARN_RE = re.compile(r'^arn:aws[a-z-]*:kms:[a-z0-9-]+:\d{12}:key/(mrk-)?[0-9a-f-]{32,36}$')
+
+# Shared client config: keep TCP connections alive so the per-key calls in a batch
+# reuse one TLS session instead of paying a handshake each, pool enough connections
+# for the executor's fan-out, and back off automatically on KMS throttles.
+_CFG = Config(
+    retries={'max_attempts': 8, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    max_pool_connections=32,
+    connect_timeout=3,
+    read_timeout=10
+)
+
+# Session and clients are expensive to build (service model loading, endpoint
+# resolution), so construct them once per container and reuse across warm
+# invocations instead of rebuilding them in every lambda_handler call.
+_SESSION = boto3.Session()
+_STS = _SESSION.client('sts', config=_CFG)
+_CLIENTS = {}
+
+# The execution role's account never changes for the lifetime of a container,
+# so the STS lookup only needs to happen on the first invocation.
+_ACCOUNT_ID = None
+
+def _account_id():
+    global _ACCOUNT_ID
+    if _ACCOUNT_ID is None:
+        _ACCOUNT_ID = _STS.get_caller_identity()['Account']
+    return _ACCOUNT_ID
+
+def _client(service, region):
+    client = _CLIENTS.get((service, region))
+    if client is None:
+        client = _CLIENTS[(service, region)] = _SESSION.client(service, region_name=region, config=_CFG)
+    return client
+
+def _kms(region):
+    return _client('kms', region)
+
+# Run a per-key closure over every ARN in the batch. Failures are collected off
+# the futures in a single pass afterwards — the closures stay free of try/except
+# on the happy path, and a failure on one key never aborts work on the others.
+# error_msg is a lazy %-format taking (arn, exception).
+def _for_each_key(process, key_arns, error_msg="Unexpected error processing key %s: %s"):
+    futures = [_EXECUTOR.submit(process, arn) for arn in key_arns]
+    for arn, future in zip(key_arns, futures):
+        exc = future.exception()
+        if exc is not None:
+            logger.error(error_msg, arn, exc)
+
+# Fetch tags for the whole batch through the Resource Groups Tagging API, which
+# returns up to 100 resources per call — ceil(N/100) round trips instead of one
+# ListResourceTags call per key. Returns None (caller falls back to per-key
+# lookups) if the API is unavailable, e.g. the role lacks tag:GetResources.
+def _prefetch_tags(region, key_arns):
+    tag_map_by_arn = {}
+    try:
+        paginator = _client('resourcegroupstaggingapi', region).get_paginator('get_resources')
+        for start in range(0, len(key_arns), 100):
+            chunk = key_arns[start:start + 100]
+            for page in paginator.paginate(ResourceTypeFilters=['kms'], ResourceARNList=chunk):
+                for resource in page['ResourceTagMappingList']:
+                    tag_map_by_arn[resource['ResourceARN']] = {
+                        tag['Key']: tag['Value'] for tag in resource['Tags']
+                    }
+    except ClientError as e:
+        logger.warning("Bulk tag lookup failed, falling back to per-key lookups: %s", e)
+        return None
+    return tag_map_by_arn
+
+# Dedicated pool for the nested tag prefetch below. The per-key closures already
+# occupy _EXECUTOR's workers, and blocking on a future submitted to the same
+# saturated pool could deadlock.
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("KMS_MAX_WORKERS", "16")))
+
+# Fire ListResourceTags concurrently with the DescribeKey status probe so a key
+# costs one round trip of latency instead of two. Returns the status plus a future
+# for the tag response; callers that bail on the status can just drop the future.
+def _status_and_tags(kms_client, arn):
+    tags_future = _PREFETCH_EXECUTOR.submit(kms_client.list_resource_tags, KeyId=arn)
+    return key_status(kms_client, arn), tags_future
+
 # Helper to get the status of a KMS key (e.g., Enabled, Disabled, PendingDeletion, etc.)
 def key_status(kms_client, arn):
     try:
@@ -20,137 +122,157 @@ def key_status(kms_client, arn):
 
 # Disable a list of keys and tag them with the current date
 def disable_keys(kms_client, key_arns, dry_run=False):
-    for arn in key_arns:
+    # Stamp the whole batch with one date, computed once — this also keeps the
+    # DisabledOn tag consistent if a batch happens to straddle midnight.
+    today = datetime.date.today().isoformat()
+
+    def _process(arn):
         if dry_run:
             # Just simulate what would happen
             status = key_status(kms_client, arn)
             if status != 'NotFound':
-                logger.info(f"Key {arn} would be disabled. (Dry Run)")
+                logger.info("Key %s would be disabled. (Dry Run)", arn)
             else:
-                logger.info(f"Key {arn} not found. (Dry Run)")
+                logger.info("Key %s not found. (Dry Run)", arn)
         else:
-            try:
-                kms_client.disable_key(KeyId=arn)
-                kms_client.tag_resource(
-                    KeyId=arn,
-                    Tags=[{
-                        'TagKey': 'DisabledOn',
-                        'TagValue': datetime.datetime.now().strftime('%Y-%m-%d')
-                    }]
-                )
-                logger.info(f"Key {arn} disabled")
-            except ClientError as e:
-                logger.error(f"Failed to disable key {arn}: {e}")
+            kms_client.disable_key(KeyId=arn)
+            kms_client.tag_resource(
+                KeyId=arn,
+                Tags=[{
+                    'TagKey': 'DisabledOn',
+                    'TagValue': today
+                }]
+            )
+            logger.info("Key %s disabled", arn)
+
+    _for_each_key(_process, key_arns, "Failed to disable key %s: %s")
 
 # Enable a list of keys and remove the "DisabledOn" tag if present
-def enable_keys(kms_client, key_arns):
-    for arn in key_arns:
-        try:
+def enable_keys(kms_client, key_arns, tag_map_by_arn=None):
+    def _process(arn):
+        tags_future = None
+        if tag_map_by_arn is None:
+            status, tags_future = _status_and_tags(kms_client, arn)
+        else:
             status = key_status(kms_client, arn)
-            if status == 'NotFound':
-                logger.info(f"Key {arn} not found")
-                continue
-
-            kms_client.enable_key(KeyId=arn)
-            tags = kms_client.list_resource_tags(KeyId=arn)
-            if any(tag['TagKey'] == 'DisabledOn' for tag in tags['Tags']):
-                kms_client.untag_resource(KeyId=arn, TagKeys=['DisabledOn'])
-            logger.info(f"Key {arn} enabled")
-        except ClientError as e:
-            logger.error(f"Failed to enable key {arn}: {e}")
+        if status == 'NotFound':
+            logger.info("Key %s not found", arn)
+            return
+
+        kms_client.enable_key(KeyId=arn)
+        tag_map = (tag_map_by_arn.get(arn, {}) if tags_future is None
+                   else {tag['TagKey']: tag['TagValue'] for tag in tags_future.result()['Tags']})
+        if 'DisabledOn' in tag_map:
+            kms_client.untag_resource(KeyId=arn, TagKeys=['DisabledOn'])
+        logger.info("Key %s enabled", arn)
+
+    _for_each_key(_process, key_arns, "Failed to enable key %s: %s")
 
 # Schedule keys for deletion if they're not in use by certain AWS services
-def schedule_key_deletion(kms_client, key_arns, deletion_days, dry_run=False):
+def schedule_key_deletion(kms_client, key_arns, deletion_days, dry_run=False, tag_map_by_arn=None):
     # Some services like RDS or S3 often require active keys, so we skip those
     excluded_services = ['dynamodb', 'efs', 'elasticache', 'rds', 's3']
 
-    for arn in key_arns:
+    def _process(arn):
         try:
-            status = key_status(kms_client, arn)
+            tags_future = None
+            if tag_map_by_arn is None:
+                status, tags_future = _status_and_tags(kms_client, arn)
+            else:
+                status = key_status(kms_client, arn)
             if status == 'PendingDeletion':
-                logger.info(f"Key {arn} already scheduled for deletion.")
-                continue
-
-            tags = kms_client.list_resource_tags(KeyId=arn)
-            service_tag = next((tag for tag in tags['Tags'] if tag['TagKey'] == 'service_name'), None)
+                logger.info("Key %s already scheduled for deletion.", arn)
+                return
 
-            if service_tag and service_tag['TagValue'] in excluded_services:
-                logger.warning(f"Key {arn} is in use by {service_tag['TagValue']} — skipping deletion.")
-                continue
+            # Index the tags by key so the eligibility lookups below are single
+            # dict probes.
+            tag_map = (tag_map_by_arn.get(arn, {}) if tags_future is None
+                       else {tag['TagKey']: tag['TagValue'] for tag in tags_future.result()['Tags']})
 
-            disabled_tag = next((tag for tag in tags['Tags'] if tag['TagKey'] == 'DisabledOn'), None)
+            if tag_map.get('service_name') in excluded_services:
+                logger.warning("Key %s is in use by %s — skipping deletion.", arn, tag_map['service_name'])
+                return
 
-            if disabled_tag:
+            if 'DisabledOn' in tag_map:
                 if dry_run:
-                    logger.info(f"Key {arn} would be scheduled for deletion in {deletion_days} days. (Dry Run)")
+                    logger.info("Key %s would be scheduled for deletion in %s days. (Dry Run)", arn, deletion_days)
                 else:
                     kms_client.schedule_key_deletion(KeyId=arn, PendingWindowInDays=deletion_days)
-                    logger.info(f"Key {arn} scheduled for deletion in {deletion_days} days.")
+                    logger.info("Key %s scheduled for deletion in %s days.", arn, deletion_days)
             else:
-                logger.info(f"Key {arn} is not disabled — skipping deletion.")
+                logger.info("Key %s is not disabled — skipping deletion.", arn)
         except ClientError as e:
-            if e.response['Error']['Code'] == 'NotFoundException':
-                logger.info(f"Key {arn} not found.")
-            else:
-                logger.error(f"Failed to schedule deletion for key {arn}: {e}")
+            # A vanished key is routine here, not an error; anything else is
+            # reported by the fan-out's post-pass.
+            if e.response['Error']['Code'] != 'NotFoundException':
+                raise
+            logger.info("Key %s not found.", arn)
+
+    _for_each_key(_process, key_arns, "Failed to schedule deletion for key %s: %s")
 
 # Cancel any keys currently marked for deletion
 def cancel_key_deletion(kms_client, key_arns):
-    for arn in key_arns:
-        try:
-            status = key_status(kms_client, arn)
-            if status in ['PendingDeletion', 'PendingReplicaDeletion']:
-                kms_client.cancel_key_deletion(KeyId=arn)
-                logger.info(f"Cancelled deletion for key {arn}")
-            else:
-                logger.info(f"Key {arn} is not scheduled for deletion — nothing to cancel.")
-        except ClientError as e:
-            logger.error(f"Error cancelling deletion for key {arn}: {e}")
+    def _process(arn):
+        status = key_status(kms_client, arn)
+        if status in ['PendingDeletion', 'PendingReplicaDeletion']:
+            kms_client.cancel_key_deletion(KeyId=arn)
+            logger.info("Cancelled deletion for key %s", arn)
+        else:
+            logger.info("Key %s is not scheduled for deletion — nothing to cancel.", arn)
+
+    _for_each_key(_process, key_arns, "Error cancelling deletion for key %s: %s")
+
+# Shared payloads for the migration tag actions. botocore serializes a deep copy,
+# so handing every call (and every worker thread) the same objects is safe and
+# skips a small dict/list allocation per key.
+_MIGRATION_TAGS = [{'TagKey': 'MigrationStatus', 'TagValue': 'completed'}]
+_MIGRATION_TAG_KEYS = ['MigrationStatus']
 
 # Tag a key to indicate it has completed migration
 def tag_srk_migration(kms_client, key_arns):
-    for arn in key_arns:
-        try:
-            kms_client.tag_resource(
-                KeyId=arn,
-                Tags=[{'TagKey': 'MigrationStatus', 'TagValue': 'completed'}]
-            )
-            logger.info(f"Tagged key {arn} with MigrationStatus=completed")
-        except ClientError as e:
-            logger.error(f"Failed to tag key {arn}: {e}")
+    def _process(arn):
+        kms_client.tag_resource(KeyId=arn, Tags=_MIGRATION_TAGS)
+        logger.info("Tagged key %s with MigrationStatus=completed", arn)
+
+    _for_each_key(_process, key_arns, "Failed to tag key %s: %s")
 
 # Remove the migration tag from a key
 def remove_tag_srk_migration(kms_client, key_arns):
-    for arn in key_arns:
-        try:
-            kms_client.untag_resource(KeyId=arn, TagKeys=['MigrationStatus'])
-            logger.info(f"Removed MigrationStatus tag from key {arn}")
-        except ClientError as e:
-            logger.error(f"Failed to remove tag from key {arn}: {e}")
+    def _process(arn):
+        kms_client.untag_resource(KeyId=arn, TagKeys=_MIGRATION_TAG_KEYS)
+        logger.info("Removed MigrationStatus tag from key %s", arn)
 
-# Helper to retrieve a key's alias based on its ARN
-def get_primary_alias(kms_client, key_arn):
+    _for_each_key(_process, key_arns, "Failed to remove tag from key %s: %s")
+
+# Build a {target key ID: alias name} map for the whole region in one paginated
+# ListAliases pass, so replication does a dict lookup per key instead of a
+# ListAliases call per key.
+def build_alias_map(kms_client):
+    alias_map = {}
     try:
-        aliases = kms_client.list_aliases(KeyId=key_arn)
-        for alias in aliases['Aliases']:
-            if alias['TargetKeyId'] == key_arn.split('/')[-1]:
-                return alias['AliasName']
+        paginator = kms_client.get_paginator('list_aliases')
+        for page in paginator.paginate():
+            for alias in page['Aliases']:
+                if 'TargetKeyId' in alias:
+                    alias_map[alias['TargetKeyId']] = alias['AliasName']
     except ClientError as e:
-        logger.error(f"Error getting alias for key {key_arn}: {e}")
-    return None
+        logger.error("Error listing aliases: %s", e)
+    return alias_map
 
 # Create a replica of the key in another region (like ca-central-1 → eu-west-1)
-def replicate_key(session, primary_key_arn, primary_alias, secondary_region, dry_run=False):
+def replicate_key(kms_primary, kms_secondary, primary_key_arn, primary_alias, secondary_region, dry_run=False):
     secondary_alias = primary_alias.replace('_ca-central-1', f'_{secondary_region}')
-    kms_primary = session.client('kms', region_name='ca-central-1')
-    kms_secondary = session.client('kms', region_name=secondary_region)
 
     try:
-        policy = kms_primary.get_key_policy(KeyId=primary_key_arn, PolicyName='default')['Policy']
+        # The policy and tag reads are independent, so overlap them on the
+        # prefetch pool — one round trip of latency instead of two.
+        policy_future = _PREFETCH_EXECUTOR.submit(
+            kms_primary.get_key_policy, KeyId=primary_key_arn, PolicyName='default')
         tags = kms_primary.list_resource_tags(KeyId=primary_key_arn)['Tags']
+        policy = policy_future.result()['Policy']
 
         if dry_run:
-            logger.info(f"Would replicate key {primary_key_arn} to {secondary_region} with alias {secondary_alias}. (Dry Run)")
+            logger.info("Would replicate key %s to %s with alias %s. (Dry Run)", primary_key_arn, secondary_region, secondary_alias)
             return
 
         response = kms_primary.replicate_key(
@@ -166,36 +288,77 @@ def replicate_key(session, primary_key_arn, primary_alias, secondary_region, dry
         if tags:
             kms_secondary.tag_resource(KeyId=replica_arn, Tags=tags)
 
-        logger.info(f"Replica key created with alias {secondary_alias}")
+        logger.info("Replica key created with alias %s", secondary_alias)
     except ClientError as e:
-        logger.error(f"Error replicating key {primary_key_arn}: {e}")
+        logger.error("Error replicating key %s: %s", primary_key_arn, e)
+
+# Replicate every key in the batch to another region, resolving aliases through
+# a single region-wide alias map.
+def replicate_keys_to_region(kms_client, key_arns, secondary_region, dry_run=False):
+    alias_map = build_alias_map(kms_client)
+    # One client per region for the whole batch; via the cache these survive
+    # warm invocations too.
+    kms_primary = _kms('ca-central-1')
+    kms_secondary = _kms(secondary_region)
+
+    # Fan the per-key pipelines out like the other handlers: ReplicateKey can
+    # take seconds per key, so while one key waits on it the next key's policy
+    # and tag reads are already in flight.
+    def _process(arn):
+        alias = alias_map.get(arn.rsplit('/', 1)[-1])
+        if alias:
+            replicate_key(kms_primary, kms_secondary, arn, alias, secondary_region, dry_run)
+        else:
+            logger.warning("No alias found for %s, skipping replication.", arn)
+
+    _for_each_key(_process, key_arns, "Error replicating key %s: %s")
+
+# Jump table mapping an action name to its handler — O(1) dispatch, and adding
+# an action is one entry here instead of another elif branch. Every entry takes
+# (kms_client, key_arns, event, tag_map_by_arn) and pulls what it needs.
+_ACTIONS = {
+    'disable': lambda kms, arns, event, tags: disable_keys(
+        kms, arns, event.get('dry_run', False)),
+    'enable': lambda kms, arns, event, tags: enable_keys(kms, arns, tags),
+    'schedule_deletion': lambda kms, arns, event, tags: schedule_key_deletion(
+        kms, arns, event.get('deletion_schedule_days', 30), event.get('dry_run', False), tags),
+    'cancel_deletion': lambda kms, arns, event, tags: cancel_key_deletion(kms, arns),
+    'tag_srk_migration': lambda kms, arns, event, tags: tag_srk_migration(kms, arns),
+    'remove_tag_srk_migration': lambda kms, arns, event, tags: remove_tag_srk_migration(kms, arns),
+    'replicate_ireland': lambda kms, arns, event, tags: replicate_keys_to_region(
+        kms, arns, 'eu-west-1', event.get('dry_run', False)),
+}
+
+# Actions whose handlers consume the bulk tag prefetch.
+_TAG_PREFETCH_ACTIONS = frozenset({'enable', 'schedule_deletion'})
 
 # Entry point for the Lambda function
 def lambda_handler(event, context):
     # Region to operate in; default to us-east-1 if not provided
     aws_region = event.get('aws_region', 'us-east-1')
     action = event.get('action')
-    key_arns = event.get('key_arns', [])
-    dry_run = event.get('dry_run', False)
-    deletion_days = event.get('deletion_schedule_days', 30)
+    raw_key_arns = event.get('key_arns', [])
 
-    # This is where you hardcode production accounts that should NEVER run this
-    blocked_accounts = ["111122223333"]  # Replace with your actual prod account ID(s)
+    # Drop duplicates (dict.fromkeys preserves order) and malformed ARNs before
+    # spending any API calls on them — a duplicated ARN in the event would
+    # otherwise mean duplicated disable/tag calls.
+    key_arns = [arn for arn in dict.fromkeys(raw_key_arns) if _ARN_RE.match(arn)]
+    invalid = set(raw_key_arns) - set(key_arns)
+    if invalid:
+        logger.warning("Dropping invalid key ARNs: %s", sorted(invalid))
 
-    # Get current AWS account ID
-    sts = boto3.client('sts')
-    account_id = sts.get_caller_identity().get('Account')
+    # Get current AWS account ID (cached after the first warm invocation)
+    account_id = _account_id()
 
     # Safety check: block execution in protected accounts
-    if account_id in blocked_accounts:
-        logger.warning(f"Execution blocked in account {account_id}")
+    if account_id in _BLOCKED_ACCOUNTS:
+        logger.warning("Execution blocked in account %s", account_id)
         return {
             'statusCode': 403,
             'body': 'Execution not allowed in this account'
         }
 
-    session = boto3.Session()
-    kms_client = session.client('kms', region_name=aws_region)
+    kms_client = _kms(aws_region)
 
     # If no key ARNs were provided, fail early
     if not key_arns:
@@ -205,35 +368,34 @@ def lambda_handler(event, context):
             'body': 'No key ARNs specified'
         }
 
-    # Execute the requested action
-    if action == 'disable':
-        disable_keys(kms_client, key_arns, dry_run)
-    elif action == 'enable':
-        enable_keys(kms_client, key_arns)
-    elif action == 'schedule_deletion':
-        schedule_key_deletion(kms_client, key_arns, deletion_days, dry_run)
-    elif action == 'cancel_deletion':
-        cancel_key_deletion(kms_client, key_arns)
-    elif action == 'tag_srk_migration':
-        tag_srk_migration(kms_client, key_arns)
-    elif action == 'remove_tag_srk_migration':
-        remove_tag_srk_migration(kms_client, key_arns)
-    elif action == 'replicate_ireland':
-        secondary_region = 'eu-west-1'
-        for arn in key_arns:
-            alias = get_primary_alias(kms_client, arn)
-            if alias:
-                replicate_key(session, arn, alias, secondary_region, dry_run)
-            else:
-                logger.warning(f"No alias found for {arn}, skipping replication.")
-    else:
-        logger.error(f"Unsupported action: {action}")
+    # Execute the requested action via the jump table
+    handler = _ACTIONS.get(action)
+    if handler is None:
+        logger.error("Unsupported action: %s", action)
         return {
             'statusCode': 400,
             'body': f"Unsupported action: {action}"
         }
 
+    # Tag-driven actions can grab the whole batch's tags up front in a handful
+    # of bulk calls rather than one ListResourceTags per key.
+    tag_map_by_arn = None
+    if action in _TAG_PREFETCH_ACTIONS:
+        tag_map_by_arn = _prefetch_tags(aws_region, key_arns)
+
+    handler(kms_client, key_arns, event, tag_map_by_arn)
+
     return {
         'statusCode': 200,
         'body': f"Action {action} completed"
     }
+
+# Warm the KMS connection during init so the first call inside lambda_handler
+# doesn't pay the TCP+TLS handshake on the invocation's clock — init-phase time
+# is free under provisioned concurrency and cheap otherwise. Guarded by the
+# Lambda env var so importing the module locally never touches the network.
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    try:
+        _kms(os.environ.get('AWS_REGION', 'us-east-1')).list_aliases(Limit=1)
+    except Exception:
+        pass